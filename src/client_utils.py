@@ -0,0 +1,59 @@
+import logging
+import logging.handlers
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Reconnect backoff settings
+RECONNECT_BASE_DELAY = 1  # seconds
+RECONNECT_MAX_DELAY = 300  # seconds
+
+def get_backoff_delay(attempt):
+    """Exponential backoff with jitter for the given retry attempt"""
+    delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * (2 ** (attempt - 1)))
+    return delay * (0.5 + random.random() * 0.5)
+
+def wait_for_next_sample(deadline, interval, sampler=None):
+    """Sleep until the sample slot after deadline and return that slot's deadline
+
+    If sampler is given, it is asked to take a reading just before the new
+    deadline so the sample published then is fresh.
+    """
+    deadline += interval
+
+    # If we fell more than a full interval behind, skip the missed slots
+    # instead of publishing them back-to-back
+    behind = time.monotonic() - deadline
+    if behind > interval:
+        missed = int(behind // interval) + 1
+        logger.warning(f"Sampling fell {behind:.1f}s behind schedule, skipping {missed} slot(s)")
+        deadline += missed * interval
+
+    if sampler is not None:
+        sampler.schedule(deadline)
+
+    time.sleep(max(0, deadline - time.monotonic()))
+    return deadline
+
+def setup_logging(log_file):
+    """Configure log handlers for the whole process (sensor modules log through root)"""
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # Buffer file writes, flushing when the buffer fills up or on warnings
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(formatter)
+    buffered_handler = logging.handlers.MemoryHandler(
+        capacity=100,
+        flushLevel=logging.WARNING,
+        target=file_handler
+    )
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+
+    logging.basicConfig(level=logging.INFO, handlers=[buffered_handler, console_handler])
+
+def handle_sigterm(signum, frame):
+    """Exit on SIGTERM (e.g. docker stop) so cleanup runs and buffered logs are flushed"""
+    raise SystemExit(0)
@@ -1,48 +1,72 @@
 import paho.mqtt.client as mqtt
-import json
 import time
 import logging
 import os
-from datetime import datetime
+import signal
+import socket
+from collections import deque
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
 # Import sensor modules
-from temp_sensor import get_cpu_temperature
-from system_metrics import get_system_metrics
+from sensor_sampler import SensorSampler
+from client_utils import get_backoff_delay, handle_sigterm, setup_logging, wait_for_next_sample
+from payload import PayloadEncoder, sample_layout, static_fields, timestamp_field
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("mqtt_client.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("mqtt_client")
 
 # MQTT Settings
 MQTT_BROKER = os.getenv("MQTT_BROKER", "test.mosquitto.org")
 MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
 MQTT_TOPIC = os.getenv("MQTT_TOPIC", "env_monitor/data")
-MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", f"env_monitor_{int(time.time())}")
 SAMPLE_INTERVAL = int(os.getenv("SAMPLE_INTERVAL", 60))  # Default: 60 seconds
+SENSOR_INTERVAL = float(os.getenv("SENSOR_INTERVAL", SAMPLE_INTERVAL))  # Default: once per sample, just before it is published
+DEVICE_ID = os.getenv("DEVICE_ID", "raspberry_pi_monitor")
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", f"env_monitor_{socket.gethostname()}")  # Stable and unique per host so the broker can resume the session
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", 1))  # Samples per publish, default: no batching
+MQTT_QOS = int(os.getenv("MQTT_QOS", 0))  # Default: fire-and-forget telemetry
+PAYLOAD_FORMAT = os.getenv("PAYLOAD_FORMAT", "json").lower()  # json or msgpack
+FAST_EMIT = os.getenv("FAST_EMIT")  # 1/0 forces the generated JSON encoder on/off, default: auto
+PAYLOAD_COMPRESSION = os.getenv("PAYLOAD_COMPRESSION", "zstd").lower()  # zstd, gzip or none (batches only)
+LEGACY_TS = os.getenv("LEGACY_TS", "0") == "1"  # Send an ISO 8601 "timestamp" instead of "ts_ns"
+MQTT_USERNAME = os.getenv("MQTT_USERNAME")
+MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
+MQTT_USE_TLS = os.getenv("MQTT_USE_TLS", "False").lower() == "true"
+
+# Payload fields that never change between samples
+STATIC_FIELDS = static_fields(DEVICE_ID, SAMPLE_INTERVAL)
+
+# Per-sample timestamp: nanoseconds since the epoch, or a UTC ISO 8601 string for legacy consumers
+TIMESTAMP_KEY = timestamp_field(LEGACY_TS)[0]
+
+# Reads the sensors in the background so publishing never waits on them
+sampler = SensorSampler(SENSOR_INTERVAL)
+
+# Serialize the static fields once and reuse them for every sample
+encoder = PayloadEncoder(
+    STATIC_FIELDS,
+    PAYLOAD_FORMAT,
+    layout=sample_layout(LEGACY_TS),
+    fast_emit=None if FAST_EMIT is None else FAST_EMIT == "1",
+    compression=PAYLOAD_COMPRESSION if BATCH_SIZE > 1 and PAYLOAD_COMPRESSION != "none" else None
+)
+
+# MQTT CONNACK return codes
+CONNECTION_RESPONSES = {
+    0: "Connected successfully",
+    1: "Incorrect protocol version",
+    2: "Invalid client identifier",
+    3: "Server unavailable",
+    4: "Bad username or password",
+    5: "Not authorized"
+}
 
 # MQTT Callbacks
 def on_connect(client, userdata, flags, rc):
-    connection_responses = {
-        0: "Connected successfully",
-        1: "Incorrect protocol version",
-        2: "Invalid client identifier",
-        3: "Server unavailable",
-        4: "Bad username or password",
-        5: "Not authorized"
-    }
-    
-    message = connection_responses.get(rc, f"Unknown error code: {rc}")
+    message = CONNECTION_RESPONSES.get(rc, f"Unknown error code: {rc}")
     
     if rc == 0:
         logger.info(f"Connected to MQTT broker at {MQTT_BROKER}: {message}")
@@ -56,7 +80,8 @@ def on_disconnect(client, userdata, rc):
         logger.info("Disconnected from MQTT broker")
 
 def on_publish(client, userdata, mid):
-    logger.info(f"Message {mid} published successfully")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Message {mid} published successfully")
 
 def on_log(client, userdata, level, buf):
     if level == mqtt.MQTT_LOG_ERR:
@@ -65,29 +90,21 @@ def on_log(client, userdata, level, buf):
         logger.warning(f"MQTT Warning: {buf}")
 
 def get_env_monitoring_data():
-    """Collect all available environmental data"""
+    """Collect the per-sample environmental data (see STATIC_FIELDS)"""
     # Get current timestamp
-    timestamp = datetime.now().isoformat()
+    timestamp = time.time_ns()
+    if LEGACY_TS:
+        timestamp = datetime.fromtimestamp(timestamp / 1e9, tz=timezone.utc).isoformat()
     
-    # Get CPU temperature
-    cpu_temp = get_cpu_temperature()
+    # Get the latest sensor readings and how old they are
+    reading, age = sampler.snapshot()
     
-    # Get system metrics
-    system_metrics = get_system_metrics()
-    
-    # Build the payload
+    # Build the per-sample part of the payload
     data = {
-        "device_id": os.getenv("DEVICE_ID", "raspberry_pi_monitor"),
-        "timestamp": timestamp,
-        "cpu_temperature": cpu_temp,
-        "system_metrics": system_metrics,
-        "version": "1.0.0"
-    }
-    
-    # Add additional metadata
-    data["metadata"] = {
-        "sample_interval_seconds": SAMPLE_INTERVAL,
-        "available_sensors": ["cpu_temperature", "system_metrics"]
+        TIMESTAMP_KEY: timestamp,
+        "cpu_temperature": reading["cpu_temperature"],
+        "system_metrics": reading["system_metrics"],
+        "sample_age_seconds": round(age, 3)
     }
     
     return data
@@ -108,7 +125,30 @@ def validate_data(data):
     
     return data
 
-def publish_data(client):
+def publish_payload(client, payload, wait_timeout=None):
+    """Publish an encoded payload to the MQTT broker"""
+    result = client.publish(
+        topic=MQTT_TOPIC,
+        payload=payload,
+        qos=MQTT_QOS,
+        retain=False
+    )
+    
+    # Check publish result
+    if result.rc != mqtt.MQTT_ERR_SUCCESS:
+        logger.error(f"Failed to publish message, error code: {result.rc}")
+        return False
+    
+    # Optionally block until the message has left the client
+    if wait_timeout is not None:
+        result.wait_for_publish(timeout=wait_timeout)
+        if not result.is_published():
+            logger.error(f"Message {result.mid} not published within {wait_timeout} seconds")
+            return False
+
+    return True
+
+def publish_data(client, wait_timeout=None):
     """Collect, validate and publish data to MQTT broker"""
     try:
         # Collect data
@@ -117,32 +157,43 @@ def publish_data(client):
         # Validate data
         data = validate_data(data)
         
-        # Convert to JSON
-        payload = json.dumps(data)
+        # Serialize in the configured wire format
+        payload = encoder.encode(data)
         
         # Publish to MQTT broker
-        result = client.publish(
-            topic=MQTT_TOPIC,
-            payload=payload,
-            qos=1,  # QoS 1 = At least once delivery
-            retain=False
-        )
-        
-        # Check publish result
-        if result.rc != mqtt.MQTT_ERR_SUCCESS:
-            logger.error(f"Failed to publish message, error code: {result.rc}")
-            return False
-            
-        return True
+        return publish_payload(client, payload, wait_timeout)
         
     except Exception as e:
         logger.error(f"Error publishing data: {e}")
         return False
 
-def setup_mqtt_client():
+def buffer_sample(buffer, data):
+    """Add a sample to the batch buffer, dropping it if it can't be encoded"""
+    try:
+        # Retrying can't fix a sample that doesn't encode, and left in the
+        # buffer it would fail every batch until pushed out, so check it now
+        encoder.encode(data)
+    except Exception as e:
+        logger.error(f"Dropping sample that failed to encode: {e}")
+        return False
+    
+    buffer.append(data)
+    return True
+
+def publish_batch(client, samples, wait_timeout=None):
+    """Publish buffered samples as a single message to MQTT broker"""
+    try:
+        payload = encoder.encode_batch(samples)
+        return publish_payload(client, payload, wait_timeout)
+        
+    except Exception as e:
+        logger.error(f"Error publishing batch of {len(samples)} samples: {e}")
+        return False
+
+def setup_mqtt_client(client_id=MQTT_CLIENT_ID, clean_session=False):
     """Set up and configure MQTT client"""
-    # Create MQTT client instance
-    client = mqtt.Client(client_id=MQTT_CLIENT_ID, clean_session=True)
+    # Create MQTT client instance (a persistent session keeps queued QoS 1 messages across reconnects)
+    client = mqtt.Client(client_id=client_id, clean_session=clean_session)
     
     # Set callbacks
     client.on_connect = on_connect
@@ -150,23 +201,27 @@ def setup_mqtt_client():
     client.on_publish = on_publish
     client.on_log = on_log
     
+    # Queue outgoing messages in the client instead of blocking on acks
+    client.max_inflight_messages_set(100)
+    client.max_queued_messages_set(1000)
+    
+    # Let the network loop back off between its own reconnect attempts
+    client.reconnect_delay_set(min_delay=1, max_delay=120)
+    
     # Configure authentication if provided
-    username = os.getenv("MQTT_USERNAME")
-    password = os.getenv("MQTT_PASSWORD")
-    if username and password:
-        client.username_pw_set(username, password)
+    if MQTT_USERNAME and MQTT_PASSWORD:
+        client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
     
     # Configure TLS if enabled
-    use_tls = os.getenv("MQTT_USE_TLS", "False").lower() == "true"
-    if use_tls:
+    if MQTT_USE_TLS:
         client.tls_set()
     
     return client
 
 def run_once():
     """Run data collection and MQTT publishing once (for testing)"""
-    # Set up MQTT client
-    client = setup_mqtt_client()
+    # Set up a throwaway MQTT client that doesn't take over the monitor's session
+    client = setup_mqtt_client(client_id=f"{MQTT_CLIENT_ID}_test", clean_session=True)
     
     try:
         # Connect to broker
@@ -179,16 +234,13 @@ def run_once():
         
         # Publish data once
         logger.info("Publishing environmental data (test run)")
-        success = publish_data(client)
+        success = publish_data(client, wait_timeout=5)
         
         if success:
             logger.info("Data published successfully")
         else:
             logger.error("Failed to publish data")
         
-        # Wait for message to be delivered
-        time.sleep(2)
-        
     except Exception as e:
         logger.error(f"Error in test run: {e}")
     finally:
@@ -205,27 +257,49 @@ def run_continuous():
     # Track reconnection attempts
     reconnect_count = 0
     max_reconnect_attempts = 10
-    reconnect_delay = 5  # seconds
+    
+    # Samples waiting to be published as a batch (bounded if publishing keeps failing)
+    buffer = deque(maxlen=BATCH_SIZE * 10)
+    
+    # Start reading sensors in the background
+    sampler.start()
+    
+    # Schedule samples against the monotonic clock so publish time doesn't cause drift
+    next_deadline = time.monotonic()
+    
+    # Set the broker once; every connection attempt below reuses this client and its session
+    client.connect_async(MQTT_BROKER, MQTT_PORT, keepalive=60)
+    loop_started = False
     
     try:
         while True:
             try:
-                # Connect to broker
-                if not client.is_connected():
+                # Connect to broker (once connected, the network loop reconnects on its own)
+                if not loop_started:
                     logger.info(f"Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
-                    client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
+                    client.reconnect()
                     client.loop_start()
+                    loop_started = True
                     reconnect_count = 0
                 
                 # Publish data
                 logger.info(f"Collecting and publishing environmental data (interval: {SAMPLE_INTERVAL}s)")
-                publish_success = publish_data(client)
+                if BATCH_SIZE > 1:
+                    # Buffer the sample and publish once a full batch is collected
+                    buffer_sample(buffer, validate_data(get_env_monitoring_data()))
+                    publish_success = True
+                    if len(buffer) >= BATCH_SIZE:
+                        publish_success = publish_batch(client, buffer)
+                        if publish_success:
+                            buffer.clear()
+                else:
+                    publish_success = publish_data(client)
                 
                 if not publish_success:
                     logger.warning("Failed to publish data")
                 
                 # Wait for next collection interval
-                time.sleep(SAMPLE_INTERVAL)
+                next_deadline = wait_for_next_sample(next_deadline, SAMPLE_INTERVAL, sampler)
                 
             except (ConnectionRefusedError, ConnectionError) as e:
                 # Handle connection errors with backoff strategy
@@ -235,25 +309,25 @@ def run_continuous():
                     logger.error(f"Maximum reconnection attempts ({max_reconnect_attempts}) reached")
                     raise
                 
-                wait_time = reconnect_delay * reconnect_count
-                logger.warning(f"Connection error: {e}. Attempting reconnect in {wait_time}s")
+                wait_time = get_backoff_delay(reconnect_count)
+                logger.warning(f"Connection error: {e}. Attempting reconnect in {wait_time:.1f}s")
                 time.sleep(wait_time)
                 
-                # Ensure client is stopped
-                try:
-                    client.loop_stop()
-                    client.disconnect()
-                except:
-                    pass
-                
-                # Create new client instance
-                client = setup_mqtt_client()
+                # Restart the sampling schedule after the reconnect
+                next_deadline = time.monotonic()
     
     except KeyboardInterrupt:
         logger.info("Program interrupted by user")
     except Exception as e:
         logger.error(f"Unrecoverable error: {e}")
     finally:
+        sampler.stop()
+        
+        # Flush any buffered samples before shutting down
+        if buffer and client.is_connected():
+            logger.info(f"Flushing {len(buffer)} buffered samples")
+            publish_batch(client, buffer, wait_timeout=5)
+        
         # Clean up
         try:
             client.loop_stop()
@@ -265,6 +339,9 @@ def run_continuous():
 if __name__ == "__main__":
     import sys
     
+    setup_logging("mqtt_client.log")
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    
     # Check for command line arguments
     if len(sys.argv) > 1 and sys.argv[1] == "--test":
         # Run once for testing
@@ -0,0 +1,216 @@
+import gzip
+import itertools
+
+# Prefer orjson (returns UTF-8 bytes directly), fall back to stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+# MessagePack is only needed when PAYLOAD_FORMAT=msgpack
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# zstandard is only needed when PAYLOAD_COMPRESSION=zstd
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Supported wire formats and their content types. Subscribers decode
+# "json" payloads with json.loads(payload) and "msgpack" payloads with
+# msgpack.unpackb(payload, raw=False); both yield the same dict.
+CONTENT_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack"
+}
+
+# Leading byte marking a compressed batch payload. Uncompressed JSON starts
+# with "{" and MessagePack maps with 0x8X/0xDE/0xDF, so subscribers check
+# the first byte, strip the tag and decompress before decoding.
+COMPRESSION_TAGS = {
+    "zstd": b"\x01",
+    "gzip": b"\x02"
+}
+
+# Batches smaller than this are sent uncompressed
+COMPRESSION_THRESHOLD = 512  # bytes
+
+# Version of the payload schema sent with every message
+PAYLOAD_VERSION = "1.0.0"
+
+# Shape of a successful system_metrics.get_system_metrics() reading
+SYSTEM_METRICS_LAYOUT = {
+    "cpu_percent": float,
+    "memory_percent": float,
+    "disk_percent": float,
+    "network": {
+        "bytes_sent": int,
+        "bytes_recv": int
+    }
+}
+
+# bytes %-format used for each leaf type of a sample layout
+_LEAF_FORMATS = {
+    str: b"%s",  # pre-encoded with dumps() so it is quoted and escaped
+    float: b"%r",
+    int: b"%d"
+}
+
+def dumps(data):
+    """Serialize data to UTF-8 encoded JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode("utf-8")
+
+def timestamp_field(legacy_ts=False):
+    """Return the per-sample timestamp key and type
+
+    Nanoseconds since the epoch under "ts_ns", or a UTC ISO 8601 string
+    under "timestamp" for legacy consumers.
+    """
+    return ("timestamp", str) if legacy_ts else ("ts_ns", int)
+
+def static_fields(device_id, sample_interval):
+    """Return the payload fields that never change between samples"""
+    return {
+        "device_id": device_id,
+        "version": PAYLOAD_VERSION,
+        "metadata": {
+            "sample_interval_seconds": sample_interval,
+            "available_sensors": ["cpu_temperature", "system_metrics"]
+        }
+    }
+
+def sample_layout(legacy_ts=False):
+    """Return the shape of a regular sample, used to generate a specialized JSON encoder"""
+    timestamp_key, timestamp_type = timestamp_field(legacy_ts)
+    return {
+        timestamp_key: timestamp_type,
+        "cpu_temperature": float,
+        "system_metrics": SYSTEM_METRICS_LAYOUT,
+        "sample_age_seconds": float
+    }
+
+def compile_emitter(prefix, layout):
+    """Generate a function serializing samples shaped like layout onto prefix
+
+    layout maps each key to its leaf type (str, float or int) or to a
+    nested layout dict. The generated function fills a single bytes
+    template and returns None when a sample has different keys or types.
+    """
+    lines = ["def _emit(sample):"]
+    type_checks = []
+    args = []
+    template = [prefix.replace(b"%", b"%%")]
+    names = itertools.count()
+
+    def walk(fields, var, opening):
+        lines.append(f"    if len({var}) != {len(fields)}:")
+        lines.append("        return None")
+        for i, (key, kind) in enumerate(fields.items()):
+            separator = opening if i == 0 else b","
+            template.append(separator + dumps(key).replace(b"%", b"%%") + b":")
+            name = f"v{next(names)}"
+            lines.append(f"    {name} = {var}[{key!r}]")
+            if isinstance(kind, dict):
+                walk(kind, name, b"{")
+                template.append(b"}")
+            else:
+                template.append(_LEAF_FORMATS[kind])
+                type_checks.append(f"type({name}) is not {kind.__name__}")
+                args.append(f"_dumps({name})" if kind is str else name)
+
+    walk(layout, "sample", b",")
+    template.append(b"}")
+
+    if type_checks:
+        lines.append(f"    if {' or '.join(type_checks)}:")
+        lines.append("        return None")
+    lines.append(f"    return _TEMPLATE % ({', '.join(args)},)")
+
+    namespace = {"_TEMPLATE": b"".join(template), "_dumps": dumps}
+    exec("\n".join(lines), namespace)
+    return namespace["_emit"]
+
+class PayloadEncoder:
+    """Serialize samples behind a cached prefix of the static fields"""
+
+    def __init__(self, static_fields, fmt="json", layout=None, fast_emit=None, compression=None):
+        if fmt not in CONTENT_TYPES:
+            raise ValueError(f"Unsupported payload format: {fmt}")
+        if fmt == "msgpack" and msgpack is None:
+            raise ImportError("PAYLOAD_FORMAT=msgpack requires the msgpack package")
+        if compression is not None and compression not in COMPRESSION_TAGS:
+            raise ValueError(f"Unsupported payload compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("PAYLOAD_COMPRESSION=zstd requires the zstandard package")
+
+        self.static_fields = static_fields
+        self.format = fmt
+        self.content_type = CONTENT_TYPES[fmt]
+        self._emit = None
+
+        # Compressor for large batch payloads
+        self._compress = None
+        if compression == "zstd":
+            self._compress = zstandard.ZstdCompressor(level=3).compress
+        elif compression == "gzip":
+            self._compress = lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+        self._compression_tag = COMPRESSION_TAGS.get(compression)
+
+        if fmt == "msgpack":
+            # Encode the invariant key/value pairs once; the map header
+            # depends on how many fields the sample adds
+            self._packer = msgpack.Packer(use_bin_type=True)
+            self._prefix = self._pack_pairs(static_fields)
+        else:
+            # Encode the invariant fields once, without the closing brace
+            self._prefix = dumps(static_fields)[:-1]
+
+            # The generated emitter is about twice as fast as stdlib json but
+            # half the speed of orjson, so by default only use it without orjson
+            if fast_emit is None:
+                fast_emit = orjson is None
+            if layout is not None and fast_emit:
+                self._emit = compile_emitter(self._prefix, layout)
+
+    def _pack_pairs(self, fields):
+        """Pack the key/value pairs of a dict without a map header"""
+        pack = self._packer.pack
+        return b"".join(pack(key) + pack(value) for key, value in fields.items())
+
+    def encode(self, sample):
+        """Serialize only the per-sample fields and splice them onto the prefix"""
+        if self.format == "msgpack":
+            header = self._packer.pack_map_header(len(self.static_fields) + len(sample))
+            return header + self._prefix + self._pack_pairs(sample)
+
+        if self._emit is not None:
+            try:
+                payload = self._emit(sample)
+            except (KeyError, TypeError):
+                payload = None
+            if payload is not None:
+                return payload
+
+        tail = dumps(sample)
+        if tail == b"{}":
+            return self._prefix + b"}"
+        return self._prefix + b"," + tail[1:]
+
+    def encode_batch(self, samples):
+        """Serialize several samples as one payload under a "samples" key"""
+        if self.format == "msgpack":
+            header = self._packer.pack_map_header(len(self.static_fields) + 1)
+            payload = header + self._prefix + self._pack_pairs({"samples": list(samples)})
+        else:
+            payload = self._prefix + b',"samples":' + dumps(list(samples)) + b"}"
+
+        # Repeated keys across samples compress well, but skip small batches
+        if self._compress is not None and len(payload) > COMPRESSION_THRESHOLD:
+            payload = self._compression_tag + self._compress(payload)
+        return payload
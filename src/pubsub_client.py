@@ -1,79 +1,91 @@
-import json
+import atexit
+import concurrent.futures
+import functools
 import time
 import logging
 import os
+import signal
 import sys
-from datetime import datetime
+import threading
+from collections import deque
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from google.cloud import pubsub_v1
 
 # Import sensor modules
-from temp_sensor import get_cpu_temperature
-from system_metrics import get_system_metrics
+from sensor_sampler import SensorSampler
+from client_utils import get_backoff_delay, handle_sigterm, setup_logging, wait_for_next_sample
+from payload import PayloadEncoder, sample_layout, static_fields, timestamp_field
 
 # Load environment variables
 load_dotenv()
 
-# Set up logging with absolute path
+# Log file location (absolute path, handlers are set up by setup_logging)
 LOG_DIR = os.path.dirname(os.path.abspath(__file__))
 LOG_FILE = os.path.join(os.path.dirname(LOG_DIR), "pubsub_client.log")
 
-# Create a custom logger
 logger = logging.getLogger("pubsub_client")
-logger.setLevel(logging.INFO)
-
-# Create handlers
-file_handler = logging.FileHandler(LOG_FILE)
-console_handler = logging.StreamHandler()
-
-# Create formatters and add to handlers
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-console_handler.setFormatter(formatter)
-
-# Add handlers to the logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
-
-# Log the actual path being used
-logger.info(f"Logging to file: {LOG_FILE}")
 
 # GCP Settings
 PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 TOPIC_ID = os.getenv("GCP_TOPIC_ID")
 SERVICE_ACCOUNT_KEY = os.getenv("GCP_SERVICE_ACCOUNT_KEY")
 SAMPLE_INTERVAL = int(os.getenv("SAMPLE_INTERVAL", 60))  # Default: 60 seconds
+SENSOR_INTERVAL = float(os.getenv("SENSOR_INTERVAL", SAMPLE_INTERVAL))  # Default: once per sample, just before it is published
 DEVICE_ID = os.getenv("DEVICE_ID", "raspberry_pi_001")
+PAYLOAD_FORMAT = os.getenv("PAYLOAD_FORMAT", "json").lower()  # json or msgpack
+FAST_EMIT = os.getenv("FAST_EMIT")  # 1/0 forces the generated JSON encoder on/off, default: auto
+LEGACY_TS = os.getenv("LEGACY_TS", "0") == "1"  # Send an ISO 8601 "timestamp" instead of "ts_ns"
 
 # Set environment variable for Google credentials
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_KEY
 
-logger.info(f"Using service account key: {SERVICE_ACCOUNT_KEY}")
+# Payload fields that never change between samples
+STATIC_FIELDS = static_fields(DEVICE_ID, SAMPLE_INTERVAL)
+
+# Per-sample timestamp: nanoseconds since the epoch, or a UTC ISO 8601 string for legacy consumers
+TIMESTAMP_KEY = timestamp_field(LEGACY_TS)[0]
+
+# Reads the sensors in the background so publishing never waits on them
+sampler = SensorSampler(SENSOR_INTERVAL)
+
+# Serialize the static fields once and reuse them for every sample
+encoder = PayloadEncoder(
+    STATIC_FIELDS,
+    PAYLOAD_FORMAT,
+    layout=sample_layout(LEGACY_TS),
+    fast_emit=None if FAST_EMIT is None else FAST_EMIT == "1"
+)
+
+# Publisher client shared by every publish (created on first use)
+_publisher = None
+_topic_path = None
+
+# Validated samples waiting to be published. Delivery failures are put
+# back from the publisher's callback thread, so only use the deque's
+# thread-safe append/popleft on it.
+backlog = deque(maxlen=100)
+
+# Number of messages the publisher failed to deliver
+failed_publish_count = 0
+_failed_publish_lock = threading.Lock()
 
 def get_env_monitoring_data():
-    """Collect all available environmental data"""
+    """Collect the per-sample environmental data (see STATIC_FIELDS)"""
     # Get current timestamp
-    timestamp = datetime.now().isoformat()
-    
-    # Get CPU temperature
-    cpu_temp = get_cpu_temperature()
+    timestamp = time.time_ns()
+    if LEGACY_TS:
+        timestamp = datetime.fromtimestamp(timestamp / 1e9, tz=timezone.utc).isoformat()
     
-    # Get system metrics
-    system_metrics = get_system_metrics()
+    # Get the latest sensor readings and how old they are
+    reading, age = sampler.snapshot()
     
-    # Build the payload
+    # Build the per-sample part of the payload
     data = {
-        "device_id": DEVICE_ID,
-        "timestamp": timestamp,
-        "cpu_temperature": cpu_temp,
-        "system_metrics": system_metrics,
-        "version": "1.0.0"
-    }
-    
-    # Add additional metadata (from original MQTT client)
-    data["metadata"] = {
-        "sample_interval_seconds": SAMPLE_INTERVAL,
-        "available_sensors": ["cpu_temperature", "system_metrics"]
+        TIMESTAMP_KEY: timestamp,
+        "cpu_temperature": reading["cpu_temperature"],
+        "system_metrics": reading["system_metrics"],
+        "sample_age_seconds": round(age, 3)
     }
     
     return data
@@ -94,30 +106,97 @@ def validate_data(data):
     
     return data
 
-def publish_data_to_pubsub():
-    """Collect, validate and publish data to GCP Pub/Sub"""
+def _get_publisher():
+    """Return the shared publisher client and topic path, creating them if needed"""
+    global _publisher, _topic_path
+    if _publisher is None:
+        batch_settings = pubsub_v1.types.BatchSettings(
+            max_messages=100,
+            max_bytes=1 << 20,  # 1 MiB
+            max_latency=1.0  # seconds
+        )
+        _publisher = pubsub_v1.PublisherClient(batch_settings=batch_settings)
+        _topic_path = _publisher.topic_path(PROJECT_ID, TOPIC_ID)
+        atexit.register(_stop_publisher)
+    return _publisher, _topic_path
+
+def _stop_publisher():
+    """Flush pending messages and shut down the shared publisher client"""
+    if _publisher is not None:
+        _publisher.stop()
+
+def _on_publish(data, future):
+    """Log the outcome of a publish, putting the sample back in the backlog if it failed"""
+    global failed_publish_count
     try:
-        # Create a publisher client
-        publisher = pubsub_v1.PublisherClient()
-        topic_path = publisher.topic_path(PROJECT_ID, TOPIC_ID)
-        
-        # Collect data
-        data = get_env_monitoring_data()
-        
-        # Validate data (from original MQTT client)
-        data = validate_data(data)
+        message_id = future.result()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Published message ID: {message_id}")
+    except Exception as e:
+        backlog.append(data)
+        with _failed_publish_lock:
+            failed_publish_count += 1
+            failed = failed_publish_count
+        logger.error(f"Error publishing to Pub/Sub: {e} ({failed} failed so far, sample kept for retry)")
+
+def publish_data_to_pubsub(samples=None, wait=False):
+    """Collect, validate and publish data to GCP Pub/Sub
+    
+    If samples is given (any iterable of already validated samples), those
+    are published instead of collecting a new one. A deque such as backlog
+    is drained up front. Once a sample is handed to the publisher, a
+    delivery failure puts it back in the backlog.
+    """
+    try:
+        # Reuse the shared publisher client
+        publisher, topic_path = _get_publisher()
         
-        # Convert to JSON string
-        data_str = json.dumps(data)
+        if samples is None:
+            # Collect data
+            data = get_env_monitoring_data()
+            
+            # Validate data (from original MQTT client)
+            batch = [validate_data(data)]
+        elif isinstance(samples, deque):
+            # Take every queued sample off at once: failed deliveries may be
+            # appended by the callback while we are submitting
+            batch = [samples.popleft() for _ in range(len(samples))]
+        else:
+            batch = list(samples)
         
-        # Encode as bytes
-        data_bytes = data_str.encode("utf-8")
+        # Hand every message to the publisher up front so it can batch them
+        futures = []
+        for i, data in enumerate(batch):
+            # Serialize in the configured wire format
+            try:
+                data_bytes = encoder.encode(data)
+            except Exception as e:
+                # Retrying can't fix a sample that doesn't encode, drop it
+                logger.error(f"Dropping sample that failed to encode: {e}")
+                continue
+            
+            try:
+                future = publisher.publish(
+                    topic_path,
+                    data=data_bytes,
+                    content_type=encoder.content_type
+                )
+            except Exception:
+                # Keep the samples the publisher never got for the next attempt
+                backlog.extendleft(reversed(batch[i:]))
+                raise
+            future.add_done_callback(functools.partial(_on_publish, data))
+            futures.append(future)
         
-        # Publish message
-        future = publisher.publish(topic_path, data=data_bytes)
-        message_id = future.result()
+        # Only block on delivery when explicitly asked to
+        if wait:
+            done, not_done = concurrent.futures.wait(futures, timeout=30)
+            if not_done:
+                logger.error(f"Timed out waiting for {len(not_done)} of {len(futures)} messages")
+                return False
+            for future in done:
+                future.result()
         
-        logger.info(f"Published message ID: {message_id}")
         return True
         
     except Exception as e:
@@ -129,7 +208,7 @@ def run_once():
     try:
         # Publish data once
         logger.info("Publishing environmental data (test run)")
-        success = publish_data_to_pubsub()
+        success = publish_data_to_pubsub(wait=True)
         
         if success:
             logger.info("Data published successfully")
@@ -144,16 +223,35 @@ def run_continuous():
     # Track reconnection attempts (from original MQTT client)
     reconnect_count = 0
     max_reconnect_attempts = 10
-    reconnect_delay = 5  # seconds
+    
+    # Delivery failures already counted as failed attempts
+    last_failed_count = failed_publish_count
+    
+    # Start reading sensors in the background
+    sampler.start()
+    
+    # Schedule samples against the monotonic clock so publish time doesn't cause drift
+    next_deadline = time.monotonic()
     
     try:
         logger.info(f"Starting environmental monitoring with Pub/Sub (interval: {SAMPLE_INTERVAL}s)")
         
         while True:
             try:
-                # Publish data
+                # Collect data and publish it along with anything left from failed attempts
                 logger.info(f"Collecting and publishing environmental data")
-                success = publish_data_to_pubsub()
+                backlog.append(validate_data(get_env_monitoring_data()))
+                
+                if failed_publish_count != last_failed_count:
+                    # Deliveries failed since the last cycle and their samples are
+                    # back in the backlog, back off before sending them again
+                    logger.warning(f"{failed_publish_count - last_failed_count} message(s) failed delivery")
+                    last_failed_count = failed_publish_count
+                    success = False
+                else:
+                    # While recovering, wait for delivery before resetting the backoff
+                    success = publish_data_to_pubsub(backlog, wait=reconnect_count > 0)
+                    last_failed_count = failed_publish_count
                 
                 if not success:
                     logger.warning("Failed to publish data to Pub/Sub")
@@ -166,16 +264,19 @@ def run_continuous():
                         raise Exception("Maximum reconnection attempts reached")
                         
                     # Wait with backoff strategy
-                    wait_time = reconnect_delay * reconnect_count
-                    logger.warning(f"Retrying in {wait_time}s (attempt {reconnect_count}/{max_reconnect_attempts})")
+                    wait_time = get_backoff_delay(reconnect_count)
+                    logger.warning(f"Retrying in {wait_time:.1f}s (attempt {reconnect_count}/{max_reconnect_attempts})")
                     time.sleep(wait_time)
+                    
+                    # Restart the sampling schedule after the retry
+                    next_deadline = time.monotonic()
                     continue
                 
                 # Reset reconnection counter on success
                 reconnect_count = 0
                 
                 # Wait for next collection interval
-                time.sleep(SAMPLE_INTERVAL)
+                next_deadline = wait_for_next_sample(next_deadline, SAMPLE_INTERVAL, sampler)
                 
             except Exception as e:
                 logger.error(f"Error in continuous monitoring: {e}")
@@ -188,18 +289,30 @@ def run_continuous():
                     raise
                     
                 # Wait with backoff strategy
-                wait_time = reconnect_delay * reconnect_count
-                logger.warning(f"Retrying in {wait_time}s (attempt {reconnect_count}/{max_reconnect_attempts})")
+                wait_time = get_backoff_delay(reconnect_count)
+                logger.warning(f"Retrying in {wait_time:.1f}s (attempt {reconnect_count}/{max_reconnect_attempts})")
                 time.sleep(wait_time)
+                
+                # Restart the sampling schedule after the retry
+                next_deadline = time.monotonic()
     
     except KeyboardInterrupt:
         logger.info("Program interrupted by user")
     except Exception as e:
         logger.error(f"Unrecoverable error: {e}")
     finally:
+        sampler.stop()
+        
         logger.info("Program terminated")
 
 if __name__ == "__main__":
+    setup_logging(LOG_FILE)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    
+    # Log the actual paths being used
+    logger.info(f"Logging to file: {LOG_FILE}")
+    logger.info(f"Using service account key: {SERVICE_ACCOUNT_KEY}")
+    
     # Log current working directory and script location
     logger.info(f"Current working directory: {os.getcwd()}")
     logger.info(f"Script location: {os.path.abspath(__file__)}")
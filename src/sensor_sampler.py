@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+
+# Import sensor modules
+from temp_sensor import get_cpu_temperature
+from system_metrics import get_system_metrics
+
+logger = logging.getLogger(__name__)
+
+class SensorSampler(threading.Thread):
+    """Background thread that keeps the latest sensor readings up to date
+
+    Publishers read the latest readings under lock instead of querying the
+    sensors themselves, so slow sensor reads never delay a publish. Readings
+    are taken on a fixed monotonic schedule, which publishers can align with
+    their own through schedule() so each publish gets a fresh reading.
+    """
+
+    def __init__(self, interval, lead=1.0):
+        super().__init__(name="sensor_sampler", daemon=True)
+        self.interval = interval
+        # Seconds before a scheduled deadline to take the reading
+        self.lead = lead
+        self.lock = threading.Lock()
+        # Serializes sensor reads (CPU usage is a delta against the previous read)
+        self._sample_lock = threading.Lock()
+        self.latest = None
+        self.sampled_at = None
+        # When the next reading is due (time.monotonic())
+        self._next_read = None
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        """Read every sensor once and store the result as the latest reading"""
+        with self._sample_lock:
+            reading = {
+                "cpu_temperature": get_cpu_temperature(),
+                "system_metrics": get_system_metrics()
+            }
+            with self.lock:
+                self.latest = reading
+                self.sampled_at = time.monotonic()
+
+    def snapshot(self):
+        """Return the latest reading and its age in seconds"""
+        with self.lock:
+            reading, sampled_at = self.latest, self.sampled_at
+
+        # Nothing sampled yet (e.g. the thread was never started), read directly
+        if reading is None:
+            self.sample()
+            return self.snapshot()
+
+        return reading, time.monotonic() - sampled_at
+
+    def schedule(self, deadline):
+        """Take the next reading just before deadline (a time.monotonic() value)"""
+        with self.lock:
+            self._next_read = deadline - self.lead
+        self._wakeup.set()
+
+    def start(self):
+        """Take the first reading, then keep sampling in the background"""
+        started = time.monotonic()
+        try:
+            self.sample()
+        except Exception as e:
+            logger.error(f"Error sampling sensors: {e}")
+        with self.lock:
+            if self._next_read is None:
+                self._next_read = started + self.interval
+        super().start()
+
+    def run(self):
+        """Sample the sensors on a fixed schedule until stopped"""
+        while not self._stop_event.is_set():
+            self._wakeup.clear()
+            with self.lock:
+                due = self._next_read
+            delay = due - time.monotonic()
+            if delay > 0:
+                # schedule() and stop() cut the wait short
+                self._wakeup.wait(delay)
+                continue
+
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Error sampling sensors: {e}")
+
+            with self.lock:
+                # Advance from the due time, not the end of the read, so the
+                # schedule doesn't drift (unless schedule() moved it meanwhile)
+                if self._next_read == due:
+                    now = time.monotonic()
+                    self._next_read += self.interval
+                    if self._next_read <= now:
+                        # Fell behind, skip the missed readings
+                        self._next_read += (int((now - self._next_read) // self.interval) + 1) * self.interval
+
+    def stop(self):
+        """Ask the sampling loop to exit"""
+        self._stop_event.set()
+        self._wakeup.set()
@@ -1,36 +1,113 @@
-import psutil
 import logging
-from datetime import datetime
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("system_metrics.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger("system_metrics")
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Kernel interfaces read directly for each sample
+PROC_STAT = "/proc/stat"
+PROC_MEMINFO = "/proc/meminfo"
+PROC_NET_DEV = "/proc/net/dev"
+
+# Column offsets in /proc/stat ("cpu user nice system idle iowait irq softirq steal guest guest_nice")
+CPU_IDLE_FIELDS = slice(3, 5)  # idle, iowait
+CPU_GUEST_FIELDS = slice(8, 10)  # guest, guest_nice (already counted in user/nice)
+
+# Column offsets in /proc/net/dev after the "iface:" label
+NET_RECV_BYTES = 0
+NET_SENT_BYTES = 8
+
+# How long a disk usage reading stays valid (disk usage changes slowly)
+DISK_CACHE_SECONDS = 60
+
+# Last disk usage reading and when it was taken
+_disk_percent = None
+_disk_checked_at = 0.0
+
+# (busy, total) CPU jiffies at the previous reading
+_cpu_times = (0, 0)
+
+def read_cpu_times():
+    """Return (busy, total) jiffies from the aggregate cpu line of /proc/stat"""
+    with open(PROC_STAT, "rb") as f:
+        fields = [int(value) for value in f.readline().split()[1:]]
+    total = sum(fields) - sum(fields[CPU_GUEST_FIELDS])
+    idle = sum(fields[CPU_IDLE_FIELDS])
+    return total - idle, total
+
+# Prime the CPU counters so the first reading is meaningful
+try:
+    _cpu_times = read_cpu_times()
+except OSError as e:
+    logger.warning(f"Unable to read CPU times: {e}")
+
+def get_cpu_percent():
+    """Return CPU usage (percentage) since the previous call, without blocking"""
+    global _cpu_times
+    busy, total = read_cpu_times()
+    previous_busy, previous_total = _cpu_times
+    _cpu_times = (busy, total)
+
+    elapsed = total - previous_total
+    if elapsed <= 0:
+        return 0.0
+    return (busy - previous_busy) / elapsed * 100
+
+def get_memory_percent():
+    """Return the share of memory not available to new processes (as psutil does)"""
+    total = available = None
+    with open(PROC_MEMINFO, "rb") as f:
+        for line in f:
+            if line.startswith(b"MemTotal:"):
+                total = int(line.split()[1])
+            elif line.startswith(b"MemAvailable:"):
+                available = int(line.split()[1])
+                break
+
+    if not total or available is None:
+        raise ValueError(f"Unable to parse {PROC_MEMINFO}")
+    return (total - available) / total * 100
+
+def get_disk_percent():
+    """Return root partition usage, re-reading it at most once per DISK_CACHE_SECONDS"""
+    global _disk_percent, _disk_checked_at
+    now = time.monotonic()
+    if _disk_percent is None or now - _disk_checked_at >= DISK_CACHE_SECONDS:
+        # Same formula as psutil: space reserved for root counts as unavailable
+        stat = os.statvfs('/')
+        used = (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+        available = stat.f_bavail * stat.f_frsize
+        _disk_percent = used / (used + available) * 100 if used + available else 0.0
+        _disk_checked_at = now
+    return _disk_percent
+
+def get_network_bytes():
+    """Return (bytes_sent, bytes_recv) summed over all interfaces"""
+    with open(PROC_NET_DEV, "rb") as f:
+        # Skip the two header lines
+        lines = f.readlines()[2:]
+
+    bytes_sent = bytes_recv = 0
+    for line in lines:
+        fields = line.partition(b":")[2].split()
+        bytes_recv += int(fields[NET_RECV_BYTES])
+        bytes_sent += int(fields[NET_SENT_BYTES])
+    return bytes_sent, bytes_recv
 
 def get_system_metrics():
     """Collect system metrics from Raspberry Pi"""
     try:
-        # CPU usage (percentage)
-        cpu_percent = psutil.cpu_percent(interval=1)
+        # CPU usage (percentage) since the previous call
+        cpu_percent = get_cpu_percent()
         
         # Memory usage
-        memory = psutil.virtual_memory()
-        memory_used_percent = memory.percent
+        memory_used_percent = get_memory_percent()
         
         # Disk usage for root partition
-        disk = psutil.disk_usage('/')
-        disk_used_percent = disk.percent
+        disk_used_percent = get_disk_percent()
         
         # Network stats
-        net_io = psutil.net_io_counters()
-        bytes_sent = net_io.bytes_sent
-        bytes_recv = net_io.bytes_recv
+        bytes_sent, bytes_recv = get_network_bytes()
         
         return {
             "cpu_percent": round(cpu_percent, 1),
@@ -1,32 +1,35 @@
 import subprocess
-import re
 import logging
-from datetime import datetime
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("temp_sensor.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger("temp_sensor")
+logger = logging.getLogger(__name__)
+
+# Kernel thermal zone reporting the SoC temperature in millidegrees Celsius
+THERMAL_ZONE_PATH = "/sys/class/thermal/thermal_zone0/temp"
 
 def get_cpu_temperature():
     """Read CPU temperature from Raspberry Pi"""
+    try:
+        # Read the thermal zone directly instead of spawning a process
+        with open(THERMAL_ZONE_PATH, "rb") as f:
+            return int(f.read()) / 1000.0
+            
+    except FileNotFoundError:
+        # No thermal zone exposed, fall back to vcgencmd
+        return read_vcgencmd_temperature()
+    except Exception as e:
+        logger.error(f"Error reading CPU temperature: {e}")
+        return None
+
+def read_vcgencmd_temperature():
+    """Read CPU temperature using vcgencmd"""
     try:
         # Execute vcgencmd to get temperature
         temp_output = subprocess.check_output(['vcgencmd', 'measure_temp']).decode('utf-8')
         
-        # Extract temperature value using regex
-        temp_value = re.search(r'temp=(.*?)\'C', temp_output)
-        
-        if temp_value:
-            # Convert to float
-            return float(temp_value.group(1))
-        else:
+        # Extract the value from the fixed "temp=48.3'C" format
+        try:
+            return float(temp_output.partition('=')[2].partition("'")[0])
+        except ValueError:
             logger.error("Failed to parse temperature output")
             return None
             
@@ -0,0 +1,71 @@
+import pytest
+
+import client_utils
+from client_utils import RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY, get_backoff_delay, wait_for_next_sample
+
+@pytest.mark.parametrize("attempt", [1, 2, 5, 9, 20])
+def test_backoff_delay_is_jittered_exponential(attempt, monkeypatch):
+    delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** (attempt - 1))
+
+    monkeypatch.setattr(client_utils.random, "random", lambda: 0.0)
+    assert get_backoff_delay(attempt) == delay * 0.5
+    monkeypatch.setattr(client_utils.random, "random", lambda: 1.0)
+    assert get_backoff_delay(attempt) == delay
+
+class FakeClock:
+    """Stands in for time.monotonic and time.sleep"""
+
+    def __init__(self, now):
+        self.now = now
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(1000.0)
+    monkeypatch.setattr(client_utils.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(client_utils.time, "sleep", clock.sleep)
+    return clock
+
+def test_wait_for_next_sample_keeps_a_fixed_schedule(clock):
+    # Publishing took 2.5s of the 60s slot
+    clock.now = 1002.5
+
+    assert wait_for_next_sample(1000.0, 60) == 1060.0
+    assert clock.slept == [57.5]
+    assert clock.now == 1060.0
+
+def test_wait_for_next_sample_does_not_sleep_when_late(clock):
+    clock.now = 1070.0
+
+    assert wait_for_next_sample(1000.0, 60) == 1060.0
+    assert clock.slept == [0]
+
+def test_wait_for_next_sample_skips_missed_slots(clock):
+    # Stalled for several intervals
+    clock.now = 1250.0
+
+    assert wait_for_next_sample(1000.0, 60) == 1300.0
+    assert clock.now == 1300.0
+
+def test_handle_sigterm_exits_cleanly():
+    with pytest.raises(SystemExit) as exc_info:
+        client_utils.handle_sigterm(15, None)
+    assert exc_info.value.code == 0
+
+def test_wait_for_next_sample_schedules_the_sampler(clock):
+    scheduled = []
+
+    class Sampler:
+        def schedule(self, deadline):
+            scheduled.append((deadline, clock.now))
+
+    assert wait_for_next_sample(1000.0, 60, Sampler()) == 1060.0
+    # Scheduled before sleeping so the reading is ready at the deadline
+    assert scheduled == [(1060.0, 1000.0)]
@@ -0,0 +1,40 @@
+import json
+from collections import deque
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("paho.mqtt.client")
+
+import mqtt_client
+
+class FakeClient:
+    """Stands in for the paho client, recording published payloads"""
+
+    def __init__(self):
+        self.payloads = []
+
+    def publish(self, topic, payload, qos, retain):
+        self.payloads.append(payload)
+        return type("MQTTMessageInfo", (), {"rc": 0, "mid": len(self.payloads)})()
+
+def test_buffer_sample_drops_samples_that_fail_to_encode():
+    buffer = deque(maxlen=10)
+
+    assert mqtt_client.buffer_sample(buffer, {"ts_ns": 1})
+    assert not mqtt_client.buffer_sample(buffer, {"ts_ns": object()})
+    assert mqtt_client.buffer_sample(buffer, {"ts_ns": 3})
+
+    assert list(buffer) == [{"ts_ns": 1}, {"ts_ns": 3}]
+
+def test_batch_publishes_after_an_unencodable_sample(monkeypatch):
+    # Batches go out uncompressed so the test can read them back
+    monkeypatch.setattr(mqtt_client, "encoder", mqtt_client.PayloadEncoder(mqtt_client.STATIC_FIELDS))
+    client = FakeClient()
+    buffer = deque(maxlen=10)
+
+    for sample in [{"ts_ns": 1}, {"ts_ns": object()}, {"ts_ns": 3}]:
+        mqtt_client.buffer_sample(buffer, sample)
+
+    assert mqtt_client.publish_batch(client, buffer)
+    assert json.loads(client.payloads[0])["samples"] == [{"ts_ns": 1}, {"ts_ns": 3}]
@@ -0,0 +1,163 @@
+import gzip
+import json
+
+import pytest
+
+import payload
+from payload import COMPRESSION_TAGS, COMPRESSION_THRESHOLD, PayloadEncoder, sample_layout, static_fields
+from system_metrics import get_system_metrics
+
+STATIC_FIELDS = static_fields("raspberry_pi_monitor", 60)
+
+SAMPLE_LAYOUT = sample_layout()
+
+SAMPLE = {
+    "ts_ns": 1760000000123456789,
+    "cpu_temperature": 48.312,
+    "system_metrics": {
+        "cpu_percent": 12.5,
+        "memory_percent": 41.0,
+        "disk_percent": 63.2,
+        "network": {
+            "bytes_sent": 123456789,
+            "bytes_recv": 987654321
+        }
+    },
+    "sample_age_seconds": 0.25
+}
+
+SAMPLE_WITH_WARNINGS = dict(SAMPLE, warnings=["CPU temperature out of normal range: 95.0°C"])
+
+SAMPLE_WITHOUT_TEMPERATURE = dict(SAMPLE, cpu_temperature=None)
+
+SAMPLE_WITH_METRICS_ERROR = dict(
+    SAMPLE,
+    system_metrics={"status": "error", "message": "[Errno 2] No such file or directory: '/proc/stat'"}
+)
+
+SAMPLES = [SAMPLE, SAMPLE_WITH_WARNINGS, SAMPLE_WITHOUT_TEMPERATURE, SAMPLE_WITH_METRICS_ERROR]
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def json_backend(request, monkeypatch):
+    """Run a test against orjson and against the stdlib json fallback"""
+    if request.param == "orjson":
+        if payload.orjson is None:
+            pytest.skip("orjson is not installed")
+    else:
+        monkeypatch.setattr(payload, "orjson", None)
+        monkeypatch.setattr(payload, "json", json, raising=False)
+    return request.param
+
+def decompress(data):
+    """Strip the compression tag and decompress a batch payload"""
+    tag, body = data[:1], data[1:]
+    if tag == COMPRESSION_TAGS["zstd"]:
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(body)
+    if tag == COMPRESSION_TAGS["gzip"]:
+        return gzip.decompress(body)
+    raise AssertionError(f"Unexpected compression tag: {tag!r}")
+
+@pytest.mark.parametrize("sample", SAMPLES)
+@pytest.mark.parametrize("fast_emit", [False, True])
+def test_encode_round_trips_json(json_backend, fast_emit, sample):
+    encoder = PayloadEncoder(STATIC_FIELDS, layout=SAMPLE_LAYOUT, fast_emit=fast_emit)
+    assert (encoder._emit is not None) == fast_emit
+
+    assert json.loads(encoder.encode(sample)) == {**STATIC_FIELDS, **sample}
+
+def test_emitter_matches_generic_encoding(json_backend):
+    encoder = PayloadEncoder(STATIC_FIELDS, layout=SAMPLE_LAYOUT, fast_emit=True)
+
+    assert encoder._emit(SAMPLE) is not None
+    assert json.loads(encoder._emit(SAMPLE)) == json.loads(PayloadEncoder(STATIC_FIELDS).encode(SAMPLE))
+
+def test_emitter_accepts_live_system_metrics(json_backend):
+    encoder = PayloadEncoder(STATIC_FIELDS, layout=SAMPLE_LAYOUT, fast_emit=True)
+    sample = dict(SAMPLE, system_metrics=get_system_metrics())
+
+    # The shared layout must match what get_system_metrics() actually returns
+    assert encoder._emit(sample) is not None
+    assert json.loads(encoder.encode(sample)) == {**STATIC_FIELDS, **sample}
+
+def test_legacy_layout_uses_iso_timestamps(json_backend):
+    encoder = PayloadEncoder(STATIC_FIELDS, layout=sample_layout(legacy_ts=True), fast_emit=True)
+    sample = {"timestamp": "2025-10-09T08:53:20+00:00", **{k: v for k, v in SAMPLE.items() if k != "ts_ns"}}
+
+    assert encoder._emit(sample) is not None
+    assert json.loads(encoder.encode(sample)) == {**STATIC_FIELDS, **sample}
+
+@pytest.mark.parametrize("sample", SAMPLES[1:])
+def test_emitter_rejects_other_shapes(json_backend, sample):
+    encoder = PayloadEncoder(STATIC_FIELDS, layout=SAMPLE_LAYOUT, fast_emit=True)
+
+    assert encoder._emit(sample) is None
+
+def test_emitter_escapes_percent_signs(json_backend):
+    fields = {"device_id": "pi_%d_100%"}
+    encoder = PayloadEncoder(fields, layout={"label": str}, fast_emit=True)
+
+    sample = {"label": "50% \"quoted\" °C"}
+    assert json.loads(encoder.encode(sample)) == {**fields, **sample}
+
+def test_encode_empty_sample(json_backend):
+    encoder = PayloadEncoder(STATIC_FIELDS)
+
+    assert json.loads(encoder.encode({})) == STATIC_FIELDS
+
+def test_encode_batch_round_trips_json(json_backend):
+    encoder = PayloadEncoder(STATIC_FIELDS)
+
+    assert json.loads(encoder.encode_batch(SAMPLES)) == {**STATIC_FIELDS, "samples": SAMPLES}
+
+@pytest.mark.parametrize("sample", SAMPLES)
+def test_encode_round_trips_msgpack(sample):
+    msgpack = pytest.importorskip("msgpack")
+    encoder = PayloadEncoder(STATIC_FIELDS, "msgpack", layout=SAMPLE_LAYOUT)
+
+    assert msgpack.unpackb(encoder.encode(sample), raw=False) == {**STATIC_FIELDS, **sample}
+
+def test_encode_batch_round_trips_msgpack():
+    msgpack = pytest.importorskip("msgpack")
+    encoder = PayloadEncoder(STATIC_FIELDS, "msgpack")
+
+    decoded = msgpack.unpackb(encoder.encode_batch(SAMPLES), raw=False)
+    assert decoded == {**STATIC_FIELDS, "samples": SAMPLES}
+
+@pytest.mark.parametrize("compression", ["zstd", "gzip"])
+@pytest.mark.parametrize("fmt", ["json", "msgpack"])
+def test_encode_batch_compresses_large_batches(fmt, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    if fmt == "msgpack":
+        msgpack = pytest.importorskip("msgpack")
+        decode = lambda data: msgpack.unpackb(data, raw=False)
+    else:
+        decode = json.loads
+    encoder = PayloadEncoder(STATIC_FIELDS, fmt, compression=compression)
+    samples = SAMPLES * 5
+
+    data = encoder.encode_batch(samples)
+
+    assert data[:1] == COMPRESSION_TAGS[compression]
+    assert len(data) < len(PayloadEncoder(STATIC_FIELDS, fmt).encode_batch(samples))
+    assert decode(decompress(data)) == {**STATIC_FIELDS, "samples": samples}
+
+def test_encode_batch_skips_compressing_small_batches():
+    encoder = PayloadEncoder(STATIC_FIELDS, compression="gzip")
+
+    data = encoder.encode_batch([{"ts_ns": 1}])
+
+    assert len(data) <= COMPRESSION_THRESHOLD
+    assert json.loads(data) == {**STATIC_FIELDS, "samples": [{"ts_ns": 1}]}
+
+def test_encode_leaves_single_samples_uncompressed():
+    encoder = PayloadEncoder(STATIC_FIELDS, compression="gzip")
+
+    assert json.loads(encoder.encode(SAMPLE)) == {**STATIC_FIELDS, **SAMPLE}
+
+def test_rejects_unknown_format_and_compression():
+    with pytest.raises(ValueError):
+        PayloadEncoder(STATIC_FIELDS, "xml")
+    with pytest.raises(ValueError):
+        PayloadEncoder(STATIC_FIELDS, compression="lz4")
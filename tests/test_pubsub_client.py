@@ -0,0 +1,153 @@
+import concurrent.futures
+import json
+import os
+import time
+import types
+from collections import deque
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("google.cloud.pubsub_v1")
+
+# The client exports the key path for the Google libraries at import time
+os.environ.setdefault("GCP_SERVICE_ACCOUNT_KEY", "service-account.json")
+
+import pubsub_client
+
+class FakePublisher:
+    """Stands in for pubsub_v1.PublisherClient, recording every publish
+
+    mode decides how the returned futures complete: None leaves them
+    pending, "ok" and "fail" resolve them before publish() returns.
+    """
+
+    def __init__(self, mode=None, raise_on_call=None):
+        self.mode = mode
+        self.raise_on_call = raise_on_call
+        self.published = []
+        self.pending = []
+
+    def publish(self, topic, data, content_type):
+        if self.raise_on_call == len(self.published):
+            raise RuntimeError("publisher stopped")
+        self.published.append(json.loads(data)["ts_ns"])
+
+        future = concurrent.futures.Future()
+        if self.mode == "ok":
+            future.set_result(str(len(self.published)))
+        elif self.mode == "fail":
+            future.set_exception(RuntimeError("deadline exceeded"))
+        else:
+            self.pending.append(future)
+        return future
+
+    def fail_pending(self):
+        for future in self.pending:
+            future.set_exception(RuntimeError("deadline exceeded"))
+        self.pending.clear()
+
+@pytest.fixture
+def publisher(monkeypatch):
+    publisher = FakePublisher()
+    monkeypatch.setattr(pubsub_client, "_publisher", publisher)
+    monkeypatch.setattr(pubsub_client, "_topic_path", "projects/test/topics/env")
+    monkeypatch.setattr(pubsub_client, "failed_publish_count", 0)
+    monkeypatch.setattr(pubsub_client, "backlog", deque(maxlen=100))
+    return publisher
+
+def sample(n):
+    return {"ts_ns": n}
+
+def test_publishes_a_list_of_samples(publisher):
+    publisher.mode = "ok"
+
+    assert pubsub_client.publish_data_to_pubsub([sample(1), sample(2)], wait=True)
+    assert publisher.published == [1, 2]
+
+def test_drains_a_deque_as_samples_are_submitted(publisher):
+    pubsub_client.backlog.extend([sample(1), sample(2), sample(3)])
+
+    assert pubsub_client.publish_data_to_pubsub(pubsub_client.backlog)
+    assert publisher.published == [1, 2, 3]
+    assert list(pubsub_client.backlog) == []
+
+def test_failed_delivery_requeues_the_sample(publisher):
+    assert pubsub_client.publish_data_to_pubsub([sample(1), sample(2)])
+
+    publisher.pending[1].set_exception(RuntimeError("deadline exceeded"))
+    publisher.pending[0].set_result("1")
+
+    assert list(pubsub_client.backlog) == [sample(2)]
+    assert pubsub_client.failed_publish_count == 1
+
+def test_failed_delivery_fails_a_waiting_publish(publisher):
+    publisher.mode = "fail"
+
+    assert not pubsub_client.publish_data_to_pubsub([sample(1)], wait=True)
+    assert list(pubsub_client.backlog) == [sample(1)]
+    assert pubsub_client.failed_publish_count == 1
+
+def test_drops_samples_that_fail_to_encode(publisher):
+    pubsub_client.backlog.extend([sample(1), {"ts_ns": object()}, sample(3)])
+
+    assert pubsub_client.publish_data_to_pubsub(pubsub_client.backlog)
+    assert publisher.published == [1, 3]
+    assert list(pubsub_client.backlog) == []
+
+def test_keeps_samples_the_publisher_never_got(publisher):
+    publisher.raise_on_call = 2
+    pubsub_client.backlog.extend([sample(1), sample(2), sample(3), sample(4)])
+
+    assert not pubsub_client.publish_data_to_pubsub(pubsub_client.backlog)
+    assert publisher.published == [1, 2]
+    assert list(pubsub_client.backlog) == [sample(3), sample(4)]
+
+def test_requeue_during_drain_does_not_lose_samples(publisher):
+    # A message from an earlier cycle is still in flight
+    assert pubsub_client.publish_data_to_pubsub([sample(0)])
+    in_flight = publisher.pending.pop()
+    publisher.published.clear()
+
+    # Its delivery fails while a full backlog is being submitted
+    original_publish = publisher.publish
+    def publish(*args, **kwargs):
+        if not in_flight.done():
+            in_flight.set_exception(RuntimeError("deadline exceeded"))
+        return original_publish(*args, **kwargs)
+    publisher.publish = publish
+    pubsub_client.backlog.extend(sample(n) for n in range(1, 101))
+
+    assert pubsub_client.publish_data_to_pubsub(pubsub_client.backlog)
+    assert publisher.published == list(range(1, 101))
+    assert list(pubsub_client.backlog) == [sample(0)]
+
+def test_run_continuous_backs_off_after_delivery_failures(publisher, monkeypatch):
+    samples = iter(range(1, 100))
+    monkeypatch.setattr(pubsub_client, "get_env_monitoring_data", lambda: sample(next(samples)))
+    monkeypatch.setattr(pubsub_client, "sampler", types.SimpleNamespace(start=lambda: None, stop=lambda: None))
+    monkeypatch.setattr(pubsub_client, "get_backoff_delay", lambda attempt: attempt)
+    sleeps = []
+    monkeypatch.setattr(pubsub_client, "time", types.SimpleNamespace(
+        monotonic=time.monotonic,
+        sleep=sleeps.append
+    ))
+
+    cycles = []
+    def wait_for_next_sample(deadline, interval, sampler=None):
+        cycles.append(list(publisher.published))
+        if len(cycles) == 1:
+            # Everything sent in the first cycle fails to deliver
+            publisher.fail_pending()
+            publisher.mode = "ok"
+            return deadline
+        raise KeyboardInterrupt
+    monkeypatch.setattr(pubsub_client, "wait_for_next_sample", wait_for_next_sample)
+
+    pubsub_client.run_continuous()
+
+    # Sample 1 fails delivery. The next cycle backs off instead of sending
+    # sample 2, then the retry resends 1 along with 2 and 3
+    assert sleeps == [1]
+    assert cycles == [[1], [1, 1, 2, 3]]
+    assert list(pubsub_client.backlog) == []
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+import sensor_sampler
+from sensor_sampler import SensorSampler
+
+READ_TIME = 0.02  # seconds each fake sensor read takes
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Replace the sensors with slow fakes and record when each read started"""
+    started = []
+
+    def get_cpu_temperature():
+        started.append(time.monotonic())
+        time.sleep(READ_TIME)
+        return 45.0
+
+    monkeypatch.setattr(sensor_sampler, "get_cpu_temperature", get_cpu_temperature)
+    monkeypatch.setattr(sensor_sampler, "get_system_metrics", lambda: {"cpu_percent": 1.0})
+    return started
+
+@pytest.fixture
+def make_sampler():
+    samplers = []
+
+    def make(*args, **kwargs):
+        sampler = SensorSampler(*args, **kwargs)
+        samplers.append(sampler)
+        return sampler
+
+    yield make
+    for sampler in samplers:
+        sampler.stop()
+        if sampler.is_alive():
+            sampler.join(timeout=1)
+
+def test_start_takes_the_first_reading(reads, make_sampler):
+    sampler = make_sampler(60)
+    sampler.start()
+
+    reading, age = sampler.snapshot()
+
+    assert reading == {"cpu_temperature": 45.0, "system_metrics": {"cpu_percent": 1.0}}
+    assert age < 1
+    assert len(reads) == 1
+
+def test_snapshot_reads_directly_without_thread(reads, make_sampler):
+    sampler = make_sampler(60)
+
+    reading, _ = sampler.snapshot()
+
+    assert reading["cpu_temperature"] == 45.0
+    assert len(reads) == 1
+
+def test_readings_do_not_drift(reads, make_sampler):
+    interval = 0.1
+    sampler = make_sampler(interval)
+    sampler.start()
+    time.sleep(interval * 5.5)
+    sampler.stop()
+
+    # Reads stay on the start + k * interval grid even though each takes READ_TIME,
+    # instead of drifting by READ_TIME per reading
+    assert len(reads) == 6
+    for k, started in enumerate(reads[1:], 1):
+        assert started - reads[0] == pytest.approx(k * interval, abs=0.03)
+
+def test_schedule_reads_just_before_the_deadline(reads, make_sampler):
+    sampler = make_sampler(60, lead=0.05)
+    sampler.start()
+
+    deadline = time.monotonic() + 0.2
+    sampler.schedule(deadline)
+    time.sleep(max(0, deadline - time.monotonic()))
+    _, age = sampler.snapshot()
+
+    assert len(reads) == 2
+    assert deadline - reads[1] == pytest.approx(0.05, abs=0.03)
+    assert age < 0.05
+
+def test_sample_serializes_concurrent_reads(monkeypatch, make_sampler):
+    active = []
+    overlaps = []
+
+    def get_cpu_temperature():
+        active.append(None)
+        if len(active) > 1:
+            overlaps.append(len(active))
+        time.sleep(READ_TIME)
+        active.pop()
+        return 45.0
+
+    monkeypatch.setattr(sensor_sampler, "get_cpu_temperature", get_cpu_temperature)
+    monkeypatch.setattr(sensor_sampler, "get_system_metrics", lambda: {})
+    sampler = make_sampler(60)
+
+    threads = [threading.Thread(target=sampler.sample) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == []